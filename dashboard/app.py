@@ -1,20 +1,37 @@
 """Streamlit dashboard for monitoring serverless VM metrics stored in Redis."""
 
-import json
 import os
 import re
-from datetime import datetime
-from typing import Any, Dict, Optional
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 
+import msgpack
+import numpy as np
+import orjson
 import pandas as pd
 import redis
 import streamlit as st
 from dotenv import load_dotenv
-from streamlit_autorefresh import st_autorefresh
 
 # Load local .env if present; Kubernetes/docker can still inject env vars normally.
 load_dotenv(".env")
 
+# Patterns are compiled once at import; the dashboard re-evaluates them every refresh.
+# Exact key shape written by the runtime handler; matched anchored, no scanning.
+_CPU_AVG_KEY_RE = re.compile(r"avg-util-cpu(\d+)-60sec")
+_CPU_KEY_RE = re.compile(r"cpu(\d+)", re.IGNORECASE)
+_NET_RE = re.compile(r"network.*egress|egress")
+_MEM_RE = re.compile(r"memory.*cache|memory.*caching|cache")
+_CPU_AVG_RE = re.compile(r"avg.*cpu.*60")
+
+REFRESH_MS = int(os.environ.get("REFRESH_MS", "5000"))
+
+# Maximum points kept per chart series.
+HISTORY_MAXLEN = 500
+# Multi-series columns (e.g. a CPU label) unseen for this long are dropped.
+HISTORY_IDLE_SECONDS = 600
+
 
 def debug_env() -> Dict[str, str]:
 	"""Collect env vars used for Redis and log them for debugging."""
@@ -28,24 +45,35 @@ def debug_env() -> Dict[str, str]:
 	return env_info
 
 
-def get_redis_client() -> redis.Redis:
-	"""Create a Redis client using environment variables with safe defaults."""
+def get_redis_pool() -> redis.BlockingConnectionPool:
+	"""Create a bounded Redis connection pool from environment variables."""
 	host = os.environ.get("REDIS_HOST", "localhost")
 	port = int(os.environ.get("REDIS_PORT", "6379"))
 	db = int(os.environ.get("REDIS_DB", "0"))
-	return redis.Redis(host=host, port=port, db=db, decode_responses=True)
+	max_connections = int(os.environ.get("REDIS_MAX_CONNECTIONS", "16"))
+	# Blocking pool: concurrent viewers wait for a free connection instead of
+	# opening new sockets without limit; keepalive avoids silent idle drops.
+	return redis.BlockingConnectionPool(
+		host=host,
+		port=port,
+		db=db,
+		max_connections=max_connections,
+		timeout=5,
+		socket_keepalive=True,
+		health_check_interval=30,
+		# Payloads may be msgpack, so responses are kept as raw bytes.
+		decode_responses=False,
+	)
 
 
-def check_redis_connection() -> Dict[str, Any]:
-	"""Ping Redis to verify connectivity from inside the app/container."""
-	info: Dict[str, Any] = {"ok": False, "message": "not tested"}
-	client = get_redis_client()
-	try:
-		client.ping()
-		info.update({"ok": True, "message": "PING ok"})
-	except Exception as exc:  # Broad on purpose for diagnostics
-		info.update({"ok": False, "message": f"Erro de conexão: {exc}"})
-	return info
+@st.cache_resource(show_spinner=False)
+def cached_pool() -> redis.BlockingConnectionPool:
+	return get_redis_pool()
+
+
+def get_redis_client() -> redis.Redis:
+	"""Create a Redis client backed by the shared connection pool."""
+	return redis.Redis(connection_pool=cached_pool())
 
 
 @st.cache_resource(show_spinner=False)
@@ -53,23 +81,74 @@ def cached_client() -> redis.Redis:
 	return get_redis_client()
 
 
-def read_metrics_from_redis(key: str) -> Optional[Dict[str, Any]]:
-	"""Read and parse JSON metrics from Redis, returning None on any error."""
-	client = cached_client()
+def parse_metrics(raw_value: Optional[bytes]) -> Optional[Dict[str, Any]]:
+	"""Parse a msgpack or JSON metrics payload, returning None if missing or invalid."""
+	if raw_value is None:
+		return None
 	try:
-		raw_value = client.get(key)
-		if raw_value is None:
-			return None
-		return json.loads(raw_value)
+		# JSON objects start with "{" (or whitespace); anything else is msgpack.
+		if raw_value[:1] in b"{[ \t\r\n":
+			return orjson.loads(raw_value)
+		return msgpack.unpackb(raw_value, raw=False)
 	except Exception:
 		return None
 
 
-def find_metric(data: Dict[str, Any], pattern: str, fallback_keys: Optional[list] = None) -> Optional[float]:
-	"""Find the first metric matching regex pattern or fallback keys."""
-	regex = re.compile(pattern)
+def _fetch_dashboard_state_raw(key: str) -> Tuple[Dict[str, Any], Optional[bytes]]:
+	"""PING and GET the metrics key in a single round-trip.
+
+	Returns the connection status as {"ok": bool, "message": str} and the
+	raw payload, or None when the key is missing or unreadable.
+	"""
+	client = cached_client()
+	try:
+		# Pipelines are not thread-safe, so one is built per call; the
+		# pooled client underneath is what gets reused across reruns.
+		pipe = client.pipeline(transaction=False)
+		pipe.ping()
+		pipe.get(key)
+		_, raw_value = pipe.execute()
+	except Exception as exc:  # Broad on purpose for diagnostics
+		return {"ok": False, "message": f"Erro de conexão: {exc}"}, None
+	return {"ok": True, "message": "PING ok"}, raw_value
+
+
+# TTL stays below the refresh interval so a slightly early tick never reuses
+# the previous tick's entry.
+@st.cache_data(ttl=REFRESH_MS / 2000, show_spinner=False)
+def fetch_dashboard_state(key: str) -> Tuple[Dict[str, Any], Optional[bytes]]:
+	"""Cached fetch so reruns within one refresh tick reuse the payload."""
+	return _fetch_dashboard_state_raw(key)
+
+
+def force_refresh() -> None:
+	"""Drop the cached fetch so the next run reads Redis again."""
+	# The cache is shared by all sessions, so clearing is the only reliable bust.
+	fetch_dashboard_state.clear()
+
+
+def load_metrics(raw_value: Optional[bytes]) -> Tuple[Optional[Dict[str, Any]], bool]:
+	"""Parse the payload unless it matches the one this session saw last.
+
+	Returns the parsed metrics and whether the payload changed since the
+	last successful parse, mirroring the runtime's last_raw_value check.
+	A failed fetch leaves the stored payload untouched.
+	"""
+	if raw_value is None:
+		return None, False
+	if raw_value == st.session_state.get("_last_raw"):
+		return st.session_state["_last_payload"], False
+	data = parse_metrics(raw_value)
+	if data is not None:
+		st.session_state["_last_raw"] = raw_value
+		st.session_state["_last_payload"] = data
+	return data, True
+
+
+def find_metric(data: Dict[str, Any], pattern: re.Pattern, fallback_keys: Optional[list] = None) -> Optional[float]:
+	"""Find the first metric matching a compiled regex pattern or fallback keys."""
 	for k, v in data.items():
-		if regex.search(k):
+		if pattern.search(k):
 			try:
 				return float(v)
 			except (TypeError, ValueError):
@@ -84,103 +163,160 @@ def find_metric(data: Dict[str, Any], pattern: str, fallback_keys: Optional[list
 	return None
 
 
-def extract_cpu_metrics(data: Dict[str, Any]) -> Dict[str, float]:
-	"""Extract per-CPU 60s averages into a labeled dict sorted by CPU id."""
-	cpu_pattern = re.compile(r"cpu(\d+)", re.IGNORECASE)
-	metrics: Dict[str, float] = {}
+def extract_cpu_metrics(data: Dict[str, Any]) -> pd.Series:
+	"""Extract per-CPU 60s averages into a Series labeled and sorted by CPU id."""
+	by_id: Dict[int, float] = {}
 	for key, value in data.items():
-		if "avg" not in key or "60" not in key:
-			continue
-		match = cpu_pattern.search(key)
-		if not match:
-			continue
+		match = _CPU_AVG_KEY_RE.fullmatch(key)
+		if match is None:
+			# Lenient path for producers using a different key layout.
+			if "avg" not in key or "60" not in key:
+				continue
+			match = _CPU_KEY_RE.search(key)
+			if not match:
+				continue
 		try:
-			metrics[f"CPU {int(match.group(1))}"] = float(value)
+			by_id[int(match.group(1))] = float(value)
 		except (TypeError, ValueError):
 			continue
+	ids = np.fromiter(by_id.keys(), dtype=np.int64, count=len(by_id))
+	vals = np.fromiter(by_id.values(), dtype=np.float64, count=len(by_id))
 	# Sort by CPU number for consistent ordering
-	return dict(sorted(metrics.items(), key=lambda item: int(item[0].split()[1])))
+	order = np.argsort(ids, kind="stable")
+	return pd.Series(vals[order], index=[f"CPU {i}" for i in ids[order]], dtype=np.float64)
+
+
+def compute_metrics(data: Dict[str, Any]) -> Tuple[Optional[float], Optional[float], pd.Series, Optional[float]]:
+	"""Derive the headline metrics and per-CPU series from a parsed payload."""
+	net_egress = find_metric(
+		data,
+		pattern=_NET_RE,
+		fallback_keys=["percent-network-egress", "network-egress"],
+	)
+	mem_cache = find_metric(
+		data,
+		pattern=_MEM_RE,
+		fallback_keys=["percent-memory-cache", "percent-memory-caching"],
+	)
+	cpu_metrics = extract_cpu_metrics(data)
+	cpu_avg = None
+	if not cpu_metrics.empty:
+		cpu_avg = float(cpu_metrics.to_numpy().mean())
+	else:
+		cpu_avg = find_metric(data, pattern=_CPU_AVG_RE)
+
+	return net_egress, mem_cache, cpu_metrics, cpu_avg
 
 
 def update_history(key: str, value: Optional[float]) -> None:
 	"""Store metric history in session state for charts."""
 	if "history" not in st.session_state:
 		st.session_state["history"] = {}
-	history = st.session_state["history"].setdefault(key, [])
+	# Bounded deque keeps only the latest 500 points without copying.
+	history = st.session_state["history"].setdefault(key, deque(maxlen=HISTORY_MAXLEN))
 	if value is not None:
 		history.append({"ts": datetime.utcnow(), "value": value})
-		# Keep only the latest 500 points to avoid unbounded growth.
-		if len(history) > 500:
-			st.session_state["history"][key] = history[-500:]
 
 
-def update_multi_history(key: str, values: Dict[str, float]) -> None:
+class MultiSeriesHistory:
+	"""Fixed-size ring buffer of timestamped rows backing multi-series charts.
+
+	Rows are written in place into preallocated NumPy arrays; columns seen for
+	the first time are added as NaN-filled columns, matching how a DataFrame
+	built from a list of dicts would align them. Columns absent from every row
+	for HISTORY_IDLE_SECONDS are dropped so the buffer does not keep growing.
+	"""
+
+	def __init__(self, capacity: int = HISTORY_MAXLEN) -> None:
+		self.capacity = capacity
+		self.columns: List[str] = []
+		self._col_index: Dict[str, int] = {}
+		self._last_seen: Dict[str, datetime] = {}
+		self.values = np.empty((capacity, 0), dtype=np.float64)
+		self.ts = np.empty(capacity, dtype="datetime64[us]")
+		self.head = 0
+		self.count = 0
+
+	def append(self, ts: datetime, row: pd.Series) -> None:
+		new_cols = [c for c in row.index if c not in self._col_index]
+		if new_cols:
+			for col in new_cols:
+				self._col_index[col] = len(self.columns)
+				self.columns.append(col)
+			pad = np.full((self.capacity, len(new_cols)), np.nan)
+			self.values = np.hstack([self.values, pad])
+
+		line = np.full(len(self.columns), np.nan)
+		line[[self._col_index[c] for c in row.index]] = row.to_numpy()
+		self.values[self.head] = line
+		self.ts[self.head] = np.datetime64(ts, "us")
+		self.head = (self.head + 1) % self.capacity
+		self.count = min(self.count + 1, self.capacity)
+
+		for col in row.index:
+			self._last_seen[col] = ts
+		# Columns in this row were just refreshed, so only absent ones can go.
+		cutoff = ts - timedelta(seconds=HISTORY_IDLE_SECONDS)
+		stale = [c for c in self.columns if self._last_seen[c] < cutoff]
+		if stale:
+			self._drop_columns(stale)
+
+	def _drop_columns(self, stale: List[str]) -> None:
+		self.values = np.delete(self.values, [self._col_index[c] for c in stale], axis=1)
+		for col in stale:
+			del self._last_seen[col]
+		self.columns = [c for c in self.columns if c in self._last_seen]
+		self._col_index = {c: i for i, c in enumerate(self.columns)}
+
+	def to_dataframe(self) -> Optional[pd.DataFrame]:
+		if self.count == 0:
+			return None
+		if self.count < self.capacity:
+			# Not wrapped yet: rows 0..count are already chronological.
+			values, ts = self.values[: self.count], self.ts[: self.count]
+		else:
+			order = np.r_[self.head : self.capacity, 0 : self.head]
+			values, ts = self.values[order], self.ts[order]
+		return pd.DataFrame(values, index=pd.DatetimeIndex(ts, name="ts"), columns=self.columns)
+
+
+def update_multi_history(key: str, values: pd.Series) -> None:
 	"""Store multi-series metric history (e.g., per-CPU) for charts."""
 	if "history_multi" not in st.session_state:
 		st.session_state["history_multi"] = {}
-	history = st.session_state["history_multi"].setdefault(key, [])
-	if values:
-		record = {"ts": datetime.utcnow(), **values}
-		history.append(record)
-		if len(history) > 500:
-			st.session_state["history_multi"][key] = history[-500:]
+	history = st.session_state["history_multi"].setdefault(key, MultiSeriesHistory())
+	if not values.empty:
+		history.append(datetime.utcnow(), values)
 
 
 def history_to_dataframe(key: str) -> Optional[pd.DataFrame]:
-	series = st.session_state.get("history", {}).get(key, [])
+	series = st.session_state.get("history", {}).get(key)
 	if not series:
 		return None
-	df = pd.DataFrame(series)
+	df = pd.DataFrame(list(series))
 	df.set_index("ts", inplace=True)
 	return df
 
 
 def multi_history_to_dataframe(key: str) -> Optional[pd.DataFrame]:
-	series = st.session_state.get("history_multi", {}).get(key, [])
-	if not series:
+	history = st.session_state.get("history_multi", {}).get(key)
+	if history is None:
 		return None
-	df = pd.DataFrame(series)
-	return df.set_index("ts")
+	return history.to_dataframe()
 
 
-def main() -> None:
-	st.set_page_config(page_title="Serverless VM Metrics", layout="wide")
-	st.title("Dashboard - Serverless VM Metrics")
-
-	env_info = debug_env()
-	conn_status = check_redis_connection()
-
-	redis_key = os.environ.get("REDIS_KEY", "ifs4-proj3-output")
-	refresh_ms = int(os.environ.get("REFRESH_MS", "5000"))
-
-	st.caption(
-		f"Lendo métricas da chave Redis `{redis_key}` (atualiza a cada {refresh_ms/1000:.0f}s)."
-	)
+@st.fragment(run_every=REFRESH_MS / 1000)
+def render_metrics(redis_key: str) -> None:
+	"""Fetch and render metrics; reruns on its own every REFRESH_MS."""
+	top = st.columns([1, 4])
+	# A button inside the fragment only reruns the fragment, not the page.
+	top[0].button("Atualizar agora", on_click=force_refresh)
 
-	# Slightly bold styling for cards and charts.
-	st.markdown(
-		"""
-		<style>
-		.metric-card {background: linear-gradient(135deg, #0f172a, #111827); color: #e5e7eb; padding: 12px 14px; border-radius: 10px; border: 1px solid #1f2937; box-shadow: 0 8px 30px rgba(0,0,0,0.25);} 
-		.metric-card h3 {margin: 0 0 6px 0; font-size: 0.95rem; font-weight: 600; letter-spacing: 0.01em;}
-		.metric-card .value {font-size: 1.6rem; font-weight: 700;}
-		</style>
-		""",
-		unsafe_allow_html=True,
+	conn_status, raw_value = fetch_dashboard_state(redis_key)
+	top[1].caption(
+		"Conexão Redis: " + ("OK" if conn_status.get("ok") else str(conn_status.get("message")))
 	)
-
-	st.sidebar.write(f"Auto-refresh: {refresh_ms} ms")
-	st.sidebar.write("Redis host:", os.environ.get("REDIS_HOST", "localhost"))
-	st.sidebar.write("Redis port:", os.environ.get("REDIS_PORT", "6379"))
-	st.sidebar.button("Atualizar agora", on_click=lambda: st.rerun())
-	st.sidebar.write("Conn status:", "OK" if conn_status.get("ok") else conn_status.get("message"))
-	with st.sidebar.expander("Debug env"):
-		st.json(env_info)
-
-	# Auto refresh the page periodically to poll Redis.
-	st_autorefresh(interval=refresh_ms, key="auto_refresh")
-
-	data = read_metrics_from_redis(redis_key)
+	data, changed = load_metrics(raw_value)
 
 	if data is None:
 		st.warning(
@@ -188,28 +324,17 @@ def main() -> None:
 		)
 		return
 
-	net_egress = find_metric(
-		data,
-		pattern=r"network.*egress|egress",
-		fallback_keys=["percent-network-egress", "network-egress"],
-	)
-	mem_cache = find_metric(
-		data,
-		pattern=r"memory.*cache|memory.*caching|cache",
-		fallback_keys=["percent-memory-cache", "percent-memory-caching"],
-	)
-	cpu_metrics = extract_cpu_metrics(data)
-	cpu_avg = None
-	if cpu_metrics:
-		cpu_avg = sum(cpu_metrics.values()) / len(cpu_metrics)
+	if changed or "_last_metrics" not in st.session_state:
+		net_egress, mem_cache, cpu_metrics, cpu_avg = compute_metrics(data)
+		# Update histories for charts.
+		update_history("network_egress", net_egress)
+		update_history("memory_cache", mem_cache)
+		update_history("cpu_avg", cpu_avg)
+		update_multi_history("cpu_multi", cpu_metrics)
+		st.session_state["_last_metrics"] = (net_egress, mem_cache, cpu_metrics, cpu_avg)
 	else:
-		cpu_avg = find_metric(data, pattern=r"avg.*cpu.*60")
-
-	# Update histories for charts.
-	update_history("network_egress", net_egress)
-	update_history("memory_cache", mem_cache)
-	update_history("cpu_avg", cpu_avg)
-	update_multi_history("cpu_multi", cpu_metrics)
+		# Same payload as the previous run: reuse derived values, skip history.
+		net_egress, mem_cache, cpu_metrics, cpu_avg = st.session_state["_last_metrics"]
 
 	cols = st.columns(3)
 	cols[0].metric("Network Egress (%)", f"{net_egress:.2f}" if net_egress is not None else "—")
@@ -217,7 +342,7 @@ def main() -> None:
 	cols[2].metric("CPU Avg 60s (todos)", f"{cpu_avg:.2f}" if cpu_avg is not None else "—")
 
 	# Per-CPU cards with a slightly bolder style.
-	if cpu_metrics:
+	if not cpu_metrics.empty:
 		st.subheader("CPU por núcleo")
 		cpu_cols = st.columns(min(len(cpu_metrics), 4) or 1)
 		for idx, (label, value) in enumerate(cpu_metrics.items()):
@@ -253,5 +378,43 @@ def main() -> None:
 		st.json(data)
 
 
+def main() -> None:
+	st.set_page_config(page_title="Serverless VM Metrics", layout="wide")
+	st.title("Dashboard - Serverless VM Metrics")
+
+	# Log env vars once per browser session rather than on every rerun.
+	if "_env_logged" not in st.session_state:
+		st.session_state["_env_logged"] = debug_env()
+	env_info = st.session_state["_env_logged"]
+
+	redis_key = os.environ.get("REDIS_KEY", "ifs4-proj3-output")
+	refresh_ms = REFRESH_MS
+
+	st.caption(
+		f"Lendo métricas da chave Redis `{redis_key}` (atualiza a cada {refresh_ms/1000:.0f}s)."
+	)
+
+	# Slightly bold styling for cards and charts.
+	st.markdown(
+		"""
+		<style>
+		.metric-card {background: linear-gradient(135deg, #0f172a, #111827); color: #e5e7eb; padding: 12px 14px; border-radius: 10px; border: 1px solid #1f2937; box-shadow: 0 8px 30px rgba(0,0,0,0.25);} 
+		.metric-card h3 {margin: 0 0 6px 0; font-size: 0.95rem; font-weight: 600; letter-spacing: 0.01em;}
+		.metric-card .value {font-size: 1.6rem; font-weight: 700;}
+		</style>
+		""",
+		unsafe_allow_html=True,
+	)
+
+	st.sidebar.write(f"Auto-refresh: {refresh_ms} ms")
+	st.sidebar.write("Redis host:", os.environ.get("REDIS_HOST", "localhost"))
+	st.sidebar.write("Redis port:", os.environ.get("REDIS_PORT", "6379"))
+	with st.sidebar.expander("Debug env"):
+		st.json(env_info)
+
+	# The fragment polls Redis on its own timer; the page above is built once.
+	render_metrics(redis_key)
+
+
 if __name__ == "__main__":
 	main()
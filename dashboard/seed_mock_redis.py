@@ -3,7 +3,10 @@
 import argparse
 import json
 import os
+import time
+from typing import Union
 
+import msgpack
 import redis
 from dotenv import load_dotenv
 
@@ -11,6 +14,20 @@ from dotenv import load_dotenv
 load_dotenv(".env")
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1, got {number}")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    number = float(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be >= 0, got {number}")
+    return number
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Seed Redis with mock metrics JSON.")
     parser.add_argument(
@@ -35,34 +52,73 @@ def parse_args() -> argparse.Namespace:
         default=os.environ.get("REDIS_KEY", "2023001654-proj3-output"),
         help="Redis key to set (default: env REDIS_KEY or ifs4-proj3-output)",
     )
+    parser.add_argument(
+        "--format",
+        choices=("json", "msgpack"),
+        default="json",
+        help="Payload encoding, matching the runtime's REDIS_OUTPUT_FORMAT (default: json)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=positive_int,
+        default=1,
+        help=(
+            "Write N payload variations to the key, one every --interval seconds, so the "
+            "dashboard (and a runtime watching the key) sees N distinct updates (default: 1)"
+        ),
+    )
+    parser.add_argument(
+        "--interval",
+        type=non_negative_float,
+        default=1.0,
+        help="Seconds between writes when --repeat > 1 (default: 1.0)",
+    )
     return parser.parse_args()
 
 
-def build_mock_payload() -> dict:
+def build_mock_payload(variation: int = 0) -> dict:
     # Simple static payload; tweak as desired for testing.
+    # Each variation nudges CPU values so consecutive writes differ.
+    offset = variation * 0.01
     return {
         "percent-network-egress": 100.00,
         "percent-memory-cache": 100.00,
-        "avg-util-cpu0-60sec": 25.45,
-        "avg-util-cpu1-60sec": 25.89,
-        "avg-util-cpu2-60sec": 0.34,
-        "avg-util-cpu3-60sec": 1.12,
+        "avg-util-cpu0-60sec": round(25.45 + offset, 2),
+        "avg-util-cpu1-60sec": round(25.89 + offset, 2),
+        "avg-util-cpu2-60sec": round(0.34 + offset, 2),
+        "avg-util-cpu3-60sec": round(1.12 + offset, 2),
     }
 
 
+def encode_payload(payload: dict, fmt: str) -> Union[str, bytes]:
+    if fmt == "msgpack":
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload)
+
+
 def main() -> None:
     args = parse_args()
-    payload = build_mock_payload()
 
     client = redis.Redis(
         host=args.host,
         port=args.port,
         db=args.db,
-        decode_responses=True,
     )
 
-    client.set(args.key, json.dumps(payload))
-    print(f"Seeded key '{args.key}' on {args.host}:{args.port}/{args.db}")
+    for variation in range(args.repeat):
+        if variation:
+            # Paced so each variation is observed; back-to-back SETs would be
+            # collapsed into the last value by readers.
+            time.sleep(args.interval)
+        payload = build_mock_payload(variation)
+        # One round-trip per update: payload, schema and timestamp together.
+        with client.pipeline(transaction=False) as pipe:
+            pipe.set(args.key, encode_payload(payload, args.format))
+            pipe.set(f"{args.key}:schema", json.dumps(list(payload.keys())))
+            pipe.set(f"{args.key}:ts", str(time.time()))
+            pipe.execute()
+
+    print(f"Seeded key '{args.key}' ({args.format}, {args.repeat} write(s)) on {args.host}:{args.port}/{args.db}")
     print("Payload:")
     print(json.dumps(payload, indent=2))
 
@@ -1,5 +1,4 @@
 import importlib.util
-import json
 import os
 import sys
 import time
@@ -7,11 +6,22 @@ import traceback
 from types import ModuleType
 from typing import Any, Callable, Optional
 
+import msgpack
+import orjson
 import redis
 
 
-USER_MODULE_PATH = "/opt/usermodule.py"
+# Overridable so Kubernetes can mount the ConfigMap as a directory (subPath
+# mounts never receive ConfigMap updates, which would defeat hot reload).
+USER_MODULE_PATH = os.environ.get("USER_MODULE_PATH", "/opt/usermodule.py")
 POLL_INTERVAL_SECONDS = 5
+REDIS_MAX_CONNECTIONS = 4
+OUTPUT_FORMATS = ("json", "msgpack")
+# Upper bound on how long to block waiting for a keyspace event before
+# re-checking the input key anyway (guards against missed notifications).
+EVENT_WAIT_TIMEOUT_SECONDS = 30
+# In poll mode, try to (re)subscribe to keyspace events every N polls.
+RESUBSCRIBE_EVERY_POLLS = 12
 
 
 class Context:
@@ -31,15 +41,16 @@ def log(msg: str) -> None:
 	print(msg, flush=True)
 
 
-def load_user_handler(path: str) -> Callable[[dict, Context], Any]:
+def import_user_handler(path: str) -> Optional[Callable[[dict, Context], Any]]:
+	"""Import the user module and return its handler, or None on failure."""
 	if not os.path.isfile(path):
 		log(f"[error] User module not found at {path}")
-		sys.exit(1)
+		return None
 
 	spec = importlib.util.spec_from_file_location("usermodule", path)
 	if spec is None or spec.loader is None:
 		log("[error] Failed to create module spec for usermodule")
-		sys.exit(1)
+		return None
 
 	module = importlib.util.module_from_spec(spec)
 	try:
@@ -47,33 +58,130 @@ def load_user_handler(path: str) -> Callable[[dict, Context], Any]:
 	except Exception:
 		log("[error] Failed to load user module:")
 		traceback.print_exc()
-		sys.exit(1)
+		return None
 
 	handler = getattr(module, "handler", None)
 	if not callable(handler):
 		log("[error] usermodule.py must define a callable 'handler' function")
-		sys.exit(1)
+		return None
 
 	return handler  # type: ignore[return-value]
 
 
+def load_user_handler(path: str) -> Callable[[dict, Context], Any]:
+	handler = import_user_handler(path)
+	if handler is None:
+		sys.exit(1)
+	return handler
+
+
+def reload_user_handler_if_changed(
+	handler: Callable[[dict, Context], Any], context: Context
+) -> Callable[[dict, Context], Any]:
+	"""Re-import the user module only when its mtime changed.
+
+	A broken update is logged and the previous handler is kept.
+	"""
+	try:
+		current_mtime = os.path.getmtime(USER_MODULE_PATH)
+	except OSError:
+		return handler
+	if current_mtime == context.function_getmtime:
+		return handler
+
+	context.function_getmtime = current_mtime
+	new_handler = import_user_handler(USER_MODULE_PATH)
+	if new_handler is None:
+		log("[warn] Keeping previous handler after failed reload")
+		return handler
+	log("[info] Reloaded user module after modification")
+	return new_handler
+
+
 def parse_input(raw_value: Any) -> Optional[dict]:
 	if raw_value is None:
 		return None
 	try:
-		text = raw_value if isinstance(raw_value, str) else raw_value.decode("utf-8")
-		return json.loads(text)
+		# orjson parses bytes directly, so no decode step is needed.
+		return orjson.loads(raw_value)
 	except Exception:
 		log("[warn] Failed to parse JSON input from Redis")
 		traceback.print_exc()
 		return None
 
 
+def serialize_output(result: dict, output_format: str) -> bytes:
+	if output_format == "msgpack":
+		return msgpack.packb(result, use_bin_type=True)
+	# OPT_NON_STR_KEYS keeps json.dumps' handling of int/float dict keys.
+	return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+
+
+def subscribe_input_events(client: redis.Redis, input_key: str, quiet: bool = False) -> Optional[redis.client.PubSub]:
+	"""Subscribe to keyspace notifications for the input key.
+
+	The server config is only read, never changed: Redis may be shared, so
+	notify-keyspace-events must already include K plus $ (or A). Returns None
+	(poll mode) if the flags are explicitly off or the subscription fails.
+	If CONFIG is disabled the flags cannot be checked, so the runtime
+	subscribes anyway and relies on the EVENT_WAIT_TIMEOUT_SECONDS re-read.
+	"""
+	flags: Optional[str] = None
+	try:
+		flags = client.config_get("notify-keyspace-events").get("notify-keyspace-events")
+	except Exception as exc:
+		if not quiet:
+			log(f"[warn] Cannot read notify-keyspace-events ({exc}); subscribing anyway")
+	if isinstance(flags, bytes):
+		flags = flags.decode("utf-8")
+	if flags is not None and ("K" not in flags or not ("A" in flags or "$" in flags)):
+		if not quiet:
+			log(
+				f"[warn] notify-keyspace-events is '{flags}' (needs K and $ or A); "
+				"falling back to polling"
+			)
+		return None
+
+	try:
+		db = client.connection_pool.connection_kwargs.get("db", 0)
+		pubsub = client.pubsub(ignore_subscribe_messages=True)
+		pubsub.subscribe(f"__keyspace@{db}__:{input_key}")
+	except Exception as exc:
+		if not quiet:
+			log(f"[warn] Keyspace subscription failed ({exc}); falling back to polling")
+		return None
+	log(f"[info] Subscribed to keyspace events for '{input_key}'")
+	return pubsub
+
+
+def wait_for_input(pubsub: Optional[redis.client.PubSub]) -> Optional[redis.client.PubSub]:
+	"""Block until the input key may have changed; returns the pubsub still in use."""
+	if pubsub is None:
+		time.sleep(POLL_INTERVAL_SECONDS)
+		return None
+	try:
+		if pubsub.get_message(timeout=EVENT_WAIT_TIMEOUT_SECONDS) is not None:
+			# Coalesce bursts of writes into a single re-read.
+			while pubsub.get_message(timeout=0) is not None:
+				pass
+		return pubsub
+	except Exception:
+		log("[warn] Lost keyspace subscription; falling back to polling")
+		traceback.print_exc()
+		try:
+			pubsub.close()
+		except Exception:
+			pass
+		time.sleep(POLL_INTERVAL_SECONDS)
+		return None
+
+
 def main() -> None:
 	host = os.environ.get("REDIS_HOST", "localhost")
 	port_str = os.environ.get("REDIS_PORT", "6379")
 	input_key = os.environ.get("REDIS_INPUT_KEY", "metrics")
 	output_key = os.environ.get("REDIS_OUTPUT_KEY")
+	output_format = os.environ.get("REDIS_OUTPUT_FORMAT", "json").lower()
 
 	if output_key is None:
 		log("[error] REDIS_OUTPUT_KEY not set; exiting")
@@ -85,62 +193,104 @@ def main() -> None:
 		log(f"[error] Invalid REDIS_PORT value: {port_str}")
 		sys.exit(1)
 
+	if output_format not in OUTPUT_FORMATS:
+		log(f"[error] Invalid REDIS_OUTPUT_FORMAT value: {output_format}")
+		sys.exit(1)
+
 	handler = load_user_handler(USER_MODULE_PATH)
 	function_mtime = os.path.getmtime(USER_MODULE_PATH)
 	context = Context(host, port, input_key, output_key, function_mtime)
 
-	client = redis.Redis(host=host, port=port, decode_responses=False)
+	pool = redis.BlockingConnectionPool(
+		host=host,
+		port=port,
+		max_connections=REDIS_MAX_CONNECTIONS,
+		socket_keepalive=True,
+		health_check_interval=30,
+		decode_responses=False,
+	)
+	client = redis.Redis(connection_pool=pool)
+	pubsub = subscribe_input_events(client, input_key)
+	polls_since_subscribe = 0
 	last_raw_value: Any = None
+	last_output_payload: Optional[bytes] = None
 
 	log(
-		"Runtime started with host={host}, port={port}, input_key={input_key}, output_key={output_key}".format(
-			host=host, port=port, input_key=input_key, output_key=output_key
+		"Runtime started with host={host}, port={port}, input_key={input_key}, output_key={output_key}, output_format={output_format}".format(
+			host=host, port=port, input_key=input_key, output_key=output_key, output_format=output_format
 		)
 	)
 
 	while True:
+		if pubsub is None:
+			# Poll mode: periodically retry so a Redis blip or notifications
+			# enabled later do not leave the runtime polling for good.
+			polls_since_subscribe += 1
+			if polls_since_subscribe >= RESUBSCRIBE_EVERY_POLLS:
+				polls_since_subscribe = 0
+				pubsub = subscribe_input_events(client, input_key, quiet=True)
+
 		try:
 			raw_value = client.get(input_key)
 		except Exception:
 			log("[error] Failed to read from Redis; retrying after delay")
 			traceback.print_exc()
-			time.sleep(POLL_INTERVAL_SECONDS)
+			pubsub = wait_for_input(pubsub)
 			continue
 
 		if raw_value == last_raw_value:
-			time.sleep(POLL_INTERVAL_SECONDS)
+			pubsub = wait_for_input(pubsub)
 			continue
 
 		last_raw_value = raw_value
 
 		payload = parse_input(raw_value)
 		if payload is None:
-			time.sleep(POLL_INTERVAL_SECONDS)
+			pubsub = wait_for_input(pubsub)
 			continue
 
+		handler = reload_user_handler_if_changed(handler, context)
 		try:
 			result = handler(payload, context)
 		except Exception:
 			log("[error] Exception inside user handler")
 			traceback.print_exc()
-			time.sleep(POLL_INTERVAL_SECONDS)
+			pubsub = wait_for_input(pubsub)
 			continue
 
 		if not isinstance(result, dict):
 			log("[warn] Handler return is not a dict; skipping write")
-			time.sleep(POLL_INTERVAL_SECONDS)
+			pubsub = wait_for_input(pubsub)
 			continue
 
 		try:
-			output_payload = json.dumps(result)
-			client.set(output_key, output_payload)
-			context.last_execution = time.time()
-			log(f"[info] Processed input and wrote output to key '{output_key}'")
+			output_payload = serialize_output(result, output_format)
+			executed_at = time.time()
+			pipe = client.pipeline(transaction=False)
+			# The :ts key is written every time to signal liveness.
+			pipe.set(f"{output_key}:ts", str(executed_at))
+			if output_payload != last_output_payload:
+				pipe.set(output_key, output_payload)
+				pipe.execute()
+				log(f"[info] Processed input and wrote output to key '{output_key}'")
+			else:
+				# Unchanged: only check the key still exists instead of resending it.
+				pipe.exists(output_key)
+				_, output_exists = pipe.execute()
+				if output_exists:
+					log(f"[info] Processed input; output unchanged, kept existing '{output_key}'")
+				else:
+					client.set(output_key, output_payload)
+					log(f"[info] Output unchanged but key '{output_key}' was missing; restored it")
+			context.last_execution = executed_at
+			last_output_payload = output_payload
 		except Exception:
 			log("[error] Failed to write handler output to Redis")
 			traceback.print_exc()
+			# Redis state is unknown after an error; rewrite on the next run.
+			last_output_payload = None
 
-		time.sleep(POLL_INTERVAL_SECONDS)
+		pubsub = wait_for_input(pubsub)
 
 
 if __name__ == "__main__":